@@ -0,0 +1,104 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = "factory.db"
+# Number of idle SQLite connections kept open between requests
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+# SQLite allows one writer at a time, so only a couple of read-write connections are ever
+# opened; extra writers wait for one instead of connecting (and running the PRAGMAs) afresh
+DB_WRITER_POOL_SIZE = int(os.environ.get("DB_WRITER_POOL_SIZE", 2))
+# Longest a request waits for a pooled writer, in line with busy_timeout below
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+
+def connect(path, readonly=False):
+    """Open a SQLite connection with the app's transaction mode, row factory and PRAGMAs."""
+    # Autocommit mode: multi-statement writes open their own transaction explicitly
+    # A larger statement cache keeps each hot query compiled for the connection's lifetime
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
+    # Routes index rows by column name; set here once instead of on every request
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # Off by default in SQLite and per connection, so payments -> orders is only enforced from here
+    conn.execute("PRAGMA foreign_keys=ON")
+    if readonly:
+        # Readers never take the write lock; in WAL mode they don't wait on the writer either
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+class ConnectionPool:
+    """Keeps SQLite connections open between requests instead of reconnecting each time.
+
+    A bounded pool never opens more than ``size`` connections; acquire() waits up to
+    ``timeout`` seconds for one to be released. An unbounded pool opens extras on demand
+    and only keeps ``size`` of them idle.
+    """
+
+    def __init__(self, path, size, readonly=False, bounded=False, timeout=DB_POOL_TIMEOUT):
+        self.path = path
+        self.readonly = readonly
+        self.size = size
+        self.bounded = bounded
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._open = 0
+        self._open_lock = threading.Lock()
+
+    def _connect(self):
+        return connect(self.path, self.readonly)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        if not self.bounded:
+            return self._connect()
+        with self._open_lock:
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+        if can_open:
+            try:
+                return self._connect()
+            except BaseException:
+                with self._open_lock:
+                    self._open -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"no pooled connection to {self.path} became free within {self.timeout}s") from None
+
+    def release(self, conn):
+        # Never hand a half-finished transaction to the next request
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+db_pool = ConnectionPool(DB_PATH, DB_WRITER_POOL_SIZE, bounded=True)
+db_read_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE, readonly=True)
+
+@contextmanager
+def transaction(conn):
+    """Group several writes into one atomic commit on an autocommit connection."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -1,12 +1,22 @@
-from flask import Flask, render_template, request, redirect, jsonify, send_file, session, flash, url_for
+from flask import Flask, render_template, request, redirect, jsonify, send_file, session, flash, url_for, g, Response
 import sqlite3
+import threading
+import queue
+import atexit
+import time
 from datetime import datetime, timedelta
-import uuid
+import secrets
+import hashlib
 import math
 from mailjet_rest import Client
+from flask_caching import Cache
+from werkzeug.security import generate_password_hash, check_password_hash
+from db import DB_PATH, connect, db_pool, db_read_pool, transaction
 import os
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 import json
+from types import MappingProxyType
 from io import BytesIO
 import base64
 
@@ -14,11 +24,14 @@ app = Flask(__name__)
 # Use an environment variable for the secret key for security
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-for-local-testing')
 
+# In-process cache for aggregate queries; entries are dropped whenever orders change
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
+
 # =====================================================
 # CONFIGURATION
 # =====================================================
 
-PRODUCT_RATES = {
+PRODUCT_RATES = MappingProxyType({
     # Chain Link
     ("Chain Link", "3ft / 12 Gauge"): 80,
     ("Chain Link", "4ft / 12 Gauge"): 95,
@@ -32,7 +45,21 @@ PRODUCT_RATES = {
     ("Barbed Wire", "12x12 Gauge"): 65,
     ("Barbed Wire", "12x14 Gauge"): 70,
     ("Barbed Wire", "14x14 Gauge"): 75,
-}
+})
+
+def _rates_by_product(rates):
+    grouped = {}
+    for (product_type, dimension), rate in rates.items():
+        grouped.setdefault(product_type, {})[dimension] = rate
+    return MappingProxyType(grouped)
+
+# product type -> dimension -> rate, so calculate_cost doesn't build a tuple key per call
+_RATES = _rates_by_product(PRODUCT_RATES)
+
+# product type -> sorted dimensions, served as-is by /api/products
+PRODUCT_DIMS = MappingProxyType({
+    product_type: tuple(sorted(dims)) for product_type, dims in _RATES.items()
+})
 
 # User roles and permissions (loaded from environment variable as JSON)
 # IMPORTANT: Store user data securely, not hardcoded.
@@ -45,6 +72,19 @@ except json.JSONDecodeError:
     print("⚠️ ERROR: Could not parse APP_USERS. Using default insecure user.")
     USERS = {"admin": {"password": "admin123", "role": "owner", "name": "Admin"}}
 
+# Keep only salted hashes in memory; APP_USERS may supply "pw_hash" instead of a plaintext "password"
+USERS = {
+    username: {
+        "pw_hash": user.get("pw_hash") or generate_password_hash(user["password"]),
+        "role": user["role"],
+        "name": user["name"],
+    }
+    for username, user in USERS.items()
+}
+
+# Checked for unknown usernames so they take as long to reject as a wrong password
+_UNKNOWN_USER_HASH = generate_password_hash(secrets.token_hex(16))
+
 # Email configuration from environment variables
 # IMPORTANT: Never hardcode passwords in your code.
 EMAIL_CONFIG = {
@@ -55,9 +95,17 @@ EMAIL_CONFIG = {
 
 RECIPIENT_EMAILS = [email.strip() for email in os.environ.get("RECIPIENT_EMAILS", "").split(',') if email.strip()]
 
+# Sender and recipients don't change while the app runs, so this part of the Mailjet payload is built once
+EMAIL_SENDER = {"Email": EMAIL_CONFIG["FROM_EMAIL"], "Name": "Factory App"}
+EMAIL_RECIPIENTS = [{"Email": email} for email in RECIPIENT_EMAILS]
+
+# Order emails are sent from background workers so requests don't wait on Mailjet
+EMAIL_WORKERS = 4
+EMAIL_MAX_RETRIES = 3
+
 # Define separate workflows for different order types
-WORKFLOW_STEPS = {
-    "Material Purchase": [
+WORKFLOW_STEPS = MappingProxyType({
+    "Material Purchase": (
         "Order placed",
         "Processing",
         "Ready for dispatch",
@@ -66,8 +114,8 @@ WORKFLOW_STEPS = {
         "Settled",
         "Closed",
         "Cancelled"
-    ],
-    "Fencing Contract Job": [
+    ),
+    "Fencing Contract Job": (
         "Order placed",
         "Site Survey",
         "Estimation Approved",
@@ -78,18 +126,30 @@ WORKFLOW_STEPS = {
         "Settled",
         "Closed",
         "Cancelled"
-    ]
-}
+    )
+})
+
+# order type -> the step approval moves an order to from "Order placed"
+NEXT_AFTER_PLACED = MappingProxyType({
+    order_type: steps[steps.index("Order placed") + 1]
+    for order_type, steps in WORKFLOW_STEPS.items()
+    if "Order placed" in steps[:-1]
+})
 
 # =====================================================
 # DATABASE INITIALIZATION
 # =====================================================
 
 def init_db():
-    conn = sqlite3.connect("factory.db")
+    conn = sqlite3.connect(DB_PATH)
     try:
         cursor = conn.cursor()
 
+        # WAL is persistent in the database file; commits append to the log instead of fsyncing the db
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA wal_autocheckpoint=1000")
+
         # Orders table
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS orders (
@@ -133,10 +193,16 @@ def init_db():
         )
         """)
 
-        # Add payment_status column if it doesn't exist (for existing databases)
-        cursor.execute("PRAGMA table_info(orders)")
-        if 'payment_status' not in [col[1] for col in cursor.fetchall()]:
-            cursor.execute("ALTER TABLE orders ADD COLUMN payment_status TEXT DEFAULT 'Unpaid'")
+        # Schema migrations are numbered and recorded in user_version, so they run once per database
+        cursor.execute("PRAGMA user_version")
+        schema_version = cursor.fetchone()[0]
+
+        if schema_version < 1:
+            # Add payment_status column if it doesn't exist (for databases created before it)
+            cursor.execute("PRAGMA table_info(orders)")
+            if 'payment_status' not in [col[1] for col in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE orders ADD COLUMN payment_status TEXT DEFAULT 'Unpaid'")
+            cursor.execute("PRAGMA user_version = 1")
 
         # Customers table for better tracking
         cursor.execute("""
@@ -186,12 +252,63 @@ def init_db():
         )
         """)
 
+        # Indexes for the list filters, dashboard grouping and per-customer lookups
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_order ON payments(order_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_entity ON activity_log(entity_id, timestamp DESC)")
+
+        if schema_version < 2:
+            # Composite indexes for status / per-customer lists in created_at order
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders(customer_id, created_at DESC)")
+            # Partial: only unpaid orders, kept in created_at order so the admin queue's unpaid
+            # branch reads just those rows, already sorted
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_unpaid_created ON orders(created_at DESC) WHERE payment_status != 'Paid'")
+            # Matches the customers list sort key exactly, so its keyset pages are index range seeks
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_list_key ON customers(IFNULL(last_order_date, '') DESC, customer_id DESC)")
+
+            # Superseded by the composite indexes above, which share their leading column
+            cursor.execute("DROP INDEX IF EXISTS idx_orders_status")
+            cursor.execute("DROP INDEX IF EXISTS idx_orders_customer")
+            # Earlier forms of the customers-list and unpaid-orders indexes
+            cursor.execute("DROP INDEX IF EXISTS idx_customers_last_order")
+            cursor.execute("DROP INDEX IF EXISTS idx_orders_payment_status")
+            cursor.execute("PRAGMA user_version = 2")
+
+        if schema_version < 3:
+            # customers.mobile is UNIQUE, so its autoindex already serves the upsert lookup
+            cursor.execute("DROP INDEX IF EXISTS idx_customers_mobile")
+            # orders.mobile is only ever matched with LIKE '%...%', which can't use an index
+            cursor.execute("DROP INDEX IF EXISTS idx_orders_mobile")
+            cursor.execute("PRAGMA user_version = 3")
+
         conn.commit()
     finally:
         conn.close()
 
 init_db()
 
+# =====================================================
+# DATABASE CONNECTION POOL
+# =====================================================
+
+# Requests with these methods only read, so they get a query_only connection
+READ_ONLY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+def get_db():
+    # Borrowed on first use, so requests that never touch the database (a login POST
+    # spending its time in the password hash) don't hold one of the few writer slots
+    if 'db' not in g:
+        g.db_pool = db_read_pool if request.method in READ_ONLY_METHODS else db_pool
+        g.db = g.db_pool.acquire()
+    return g.db
+
+@app.teardown_request
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        g.db_pool.release(conn)
+
 # =====================================================
 # AUTHENTICATION & AUTHORIZATION
 # =====================================================
@@ -222,81 +339,198 @@ def role_required(*roles):
 # HELPER FUNCTIONS
 # =====================================================
 
-def log_activity(user, action, entity_type, entity_id, details=""):
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO activity_log (user, action, entity_type, entity_id, details, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user, action, entity_type, entity_id, details, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        conn.commit()
-    finally:
-        conn.close()
+def _now_str():
+    # Same "YYYY-MM-DD HH:MM:SS" text as strftime, without parsing a format string each call
+    # and as SQLite's datetime('now', 'localtime'), which the order UPDATEs use
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+SQL_INSERT_ACTIVITY = """
+    INSERT INTO activity_log (user, action, entity_type, entity_id, details, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# Activity rows are written by one background thread so requests never wait on the insert
+_log_q = queue.Queue()
+
+# The writer commits whatever arrived within ACTIVITY_LOG_BATCH_WAIT seconds of the first entry
+ACTIVITY_LOG_BATCH_SIZE = 200
+ACTIVITY_LOG_BATCH_WAIT = 0.02
+# Longest an exiting process waits for queued entries to be written
+ACTIVITY_LOG_EXIT_TIMEOUT = 5
+# A batch that hits a transient error (locked database, failed connect) is retried with
+# doubling delays before it is given up on
+ACTIVITY_LOG_MAX_ATTEMPTS = 5
+ACTIVITY_LOG_RETRY_DELAY = 0.5
+
+def _next_activity_batch():
+    batch = [_log_q.get()]
+    deadline = time.monotonic() + ACTIVITY_LOG_BATCH_WAIT
+    while len(batch) < ACTIVITY_LOG_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_log_q.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def _activity_log_writer():
+    # Its own connection, so logging never competes with requests for the writer pool
+    conn = None
+    while True:
+        batch = _next_activity_batch()
+        for attempt in range(1, ACTIVITY_LOG_MAX_ATTEMPTS + 1):
+            try:
+                if conn is None:
+                    conn = connect(DB_PATH)
+                # One transaction, so a burst of entries costs a single commit
+                with transaction(conn):
+                    conn.executemany(SQL_INSERT_ACTIVITY, batch)
+                break
+            except sqlite3.OperationalError as e:
+                # Reconnect on the next attempt in case the connection itself is the problem
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                if attempt == ACTIVITY_LOG_MAX_ATTEMPTS:
+                    print(f"[ACTIVITY LOG ERROR] {len(batch)} entries dropped after {attempt} attempts: {e}")
+                else:
+                    print(f"[ACTIVITY LOG ERROR] Attempt {attempt} failed, retrying: {e}")
+                    time.sleep(ACTIVITY_LOG_RETRY_DELAY * 2 ** (attempt - 1))
+            except Exception as e:
+                print(f"[ACTIVITY LOG ERROR] {len(batch)} entries dropped: {e}")
+                break
+        for _ in batch:
+            _log_q.task_done()
+
+# Threads don't survive fork(), so with `gunicorn --preload` a writer started at import would
+# only exist in the master. Each process starts its own on first use instead.
+_log_writer_pid = None
+_log_writer_lock = threading.Lock()
+
+def _ensure_activity_log_writer():
+    global _log_writer_pid
+    if _log_writer_pid == os.getpid():
+        return
+    with _log_writer_lock:
+        if _log_writer_pid != os.getpid():
+            threading.Thread(target=_activity_log_writer, name="activity-log", daemon=True).start()
+            _log_writer_pid = os.getpid()
+
+def _reset_activity_log_after_fork():
+    # The child gets a copy of the parent's queue (whose entries the parent will write) and
+    # possibly a lock held mid-operation, so start from fresh ones
+    global _log_q, _log_writer_lock
+    _log_q = queue.Queue()
+    _log_writer_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_activity_log_after_fork)
+
+def _drain_activity_log():
+    # Daemon threads are killed at exit, so give queued entries a bounded chance to land first
+    if _log_writer_pid != os.getpid():
+        return
+    deadline = time.monotonic() + ACTIVITY_LOG_EXIT_TIMEOUT
+    with _log_q.all_tasks_done:
+        while _log_q.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"[ACTIVITY LOG ERROR] {_log_q.unfinished_tasks} entries not written before exit")
+                return
+            _log_q.all_tasks_done.wait(remaining)
+
+atexit.register(_drain_activity_log)
+
+def log_activity(user, action, entity_type, entity_id, details="", timestamp=None):
+    _ensure_activity_log_writer()
+    # Timestamp is taken now, not whenever the writer gets to the entry
+    _log_q.put((user, action, entity_type, entity_id, details, timestamp or _now_str()))
+
+# Generated ids are 32 random bits, so collisions are possible on large tables and retried
+ID_INSERT_ATTEMPTS = 5
+
+def new_id(prefix):
+    return f"{prefix}-{secrets.token_hex(4).upper()}"
+
+def insert_with_new_id(cursor, prefix, sql, params):
+    # Runs an INSERT whose first parameter is a fresh id, drawing a new one if it already exists
+    for attempt in range(1, ID_INSERT_ATTEMPTS + 1):
+        record_id = new_id(prefix)
+        try:
+            cursor.execute(sql, (record_id, *params))
+            return record_id
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE" not in str(e) or attempt == ID_INSERT_ATTEMPTS:
+                raise
 
 def get_or_create_customer(mobile, name, address, city, state, pincode, country):
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        
-        # Check if customer exists
-        cursor.execute("SELECT customer_id FROM customers WHERE mobile = ?", (mobile,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            customer_id = existing[0]
-            # Update customer info
-            cursor.execute("""
-                UPDATE customers SET name=?, address=?, city=?, state=?, pincode=?, country=?
-                WHERE customer_id=?
-            """, (name, address, city, state, pincode, country, customer_id))
-        else:
-            # Create new customer
-            customer_id = "CUST-" + uuid.uuid4().hex[:8].upper()
-            cursor.execute("""
-                INSERT INTO customers (customer_id, name, mobile, address, city, state, pincode, country, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (customer_id, name, mobile, address, city, state, pincode, country, 
-                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        
-        conn.commit()
-        return customer_id
-    finally:
-        conn.close()
-
-def update_customer_stats(customer_id):
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE customers SET 
-                total_orders = (SELECT COUNT(*) FROM orders WHERE customer_id = ?),
-                total_spent = (SELECT COALESCE(SUM(total_cost), 0) FROM orders WHERE customer_id = ?),
-                last_order_date = (SELECT MAX(created_at) FROM orders WHERE customer_id = ?)
-            WHERE customer_id = ?
-        """, (customer_id, customer_id, customer_id, customer_id))
-        conn.commit()
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Create the customer, or refresh the stored details if the mobile is already known
+    insert_with_new_id(cursor, "CUST", """
+        INSERT INTO customers (customer_id, name, mobile, address, city, state, pincode, country, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(mobile) DO UPDATE SET
+            name=excluded.name, address=excluded.address, city=excluded.city,
+            state=excluded.state, pincode=excluded.pincode, country=excluded.country
+        RETURNING customer_id
+    """, (name, mobile, address, city, state, pincode, country,
+          _now_str()))
+    return cursor.fetchone()[0]
+
+def update_customer_stats(customer_id, order_total, order_date):
+    # Apply the new order to the running totals instead of recounting every order
+    conn = get_db()
+    conn.execute("""
+        UPDATE customers SET
+            total_orders = total_orders + 1,
+            total_spent = total_spent + ?,
+            last_order_date = ?
+        WHERE customer_id = ?
+    """, (order_total, order_date, customer_id))
+
+def adjust_customer_stats(customer_id, orders_delta, spent_delta):
+    # Keep the running totals in step when an existing order is edited or deleted
+    conn = get_db()
+    conn.execute("""
+        UPDATE customers SET
+            total_orders = total_orders + ?,
+            total_spent = total_spent + ?
+        WHERE customer_id = ?
+    """, (orders_delta, spent_delta, customer_id))
+
+def recompute_customer_stats():
+    # Full recount from the orders table, only used for admin-triggered reconciliation
+    conn = get_db()
+    conn.execute("""
+        UPDATE customers SET
+            total_orders = (SELECT COUNT(*) FROM orders WHERE orders.customer_id = customers.customer_id),
+            total_spent = (SELECT COALESCE(SUM(total_cost), 0) FROM orders WHERE orders.customer_id = customers.customer_id),
+            last_order_date = (SELECT MAX(created_at) FROM orders WHERE orders.customer_id = customers.customer_id)
+    """)
+
+# Perimeter of a square plot per sqrt(acre): 4 sides of sqrt(43560 sqft), plus 5% wastage
+_ACRE_PERIMETER_K = 4 * math.sqrt(43560) * 1.05
+
+SOIL_MULTIPLIERS = MappingProxyType({"Normal": 1.0, "Rocky": 1.4, "Clay": 1.2})
 
 def calculate_cost(acres, product_type, dimension, order_type, soil_type=None, no_of_units=0):
     perimeter = 0
-    if acres and float(acres) > 0:
-        area_sqft = float(acres) * 43560
-        side = math.sqrt(area_sqft)
-        perimeter = 4 * side
-        perimeter = perimeter * 1.05  # 5% wastage
+    acres = float(acres) if acres else 0
+    if acres > 0:
+        perimeter = _ACRE_PERIMETER_K * math.sqrt(acres)
     elif no_of_units and float(no_of_units) > 0:
         perimeter = float(no_of_units)
 
-    rate = PRODUCT_RATES.get((product_type, dimension), 120)
+    rate = _RATES.get(product_type, {}).get(dimension, 120)
     material_cost = perimeter * rate
     installation_cost = 0
     transport_cost = 0
 
     if order_type == "Fencing Contract Job":
-        soil_multiplier = {"Normal": 1.0, "Rocky": 1.4, "Clay": 1.2}
-        multiplier = soil_multiplier.get(soil_type, 1.0)
+        multiplier = SOIL_MULTIPLIERS.get(soil_type, 1.0)
         installation_cost = material_cost * 0.25 * multiplier
 
     total_cost = material_cost + installation_cost + transport_cost
@@ -312,35 +546,66 @@ def calculate_cost(acres, product_type, dimension, order_type, soil_type=None, n
         round(advance, 2)
     )
 
+_mailjet_local = threading.local()
+
+def get_mailjet_client(api_key, secret_key):
+    # One client per email worker; its HTTP session keeps the Mailjet connection alive between sends
+    client = getattr(_mailjet_local, "client", None)
+    if client is None:
+        client = Client(auth=(api_key, secret_key), version='v3.1')
+        _mailjet_local.client = client
+    return client
+
 def send_email_notification(order_data):
     api_key = EMAIL_CONFIG["MAILJET_API_KEY"]
     secret_key = EMAIL_CONFIG["MAILJET_SECRET_KEY"]
-    from_email = EMAIL_CONFIG["FROM_EMAIL"]
 
     if not api_key or not secret_key:
         print("[EMAIL] Skipping - Mailjet keys not configured.")
         return False
 
-    mailjet = Client(auth=(api_key, secret_key), version='v3.1')
-    
+    mailjet = get_mailjet_client(api_key, secret_key)
+
+    # Runs on an email worker, outside any request, so push an app context for Jinja
+    with app.app_context():
+        html_body = render_template("email_new_order.html", **order_data)
+
     data = {
         'Messages': [
             {
-                "From": {"Email": from_email, "Name": "Factory App"},
-                "To": [{"Email": email} for email in RECIPIENT_EMAILS],
+                "From": EMAIL_SENDER,
+                "To": EMAIL_RECIPIENTS,
                 "Subject": f"New Order #{order_data['order_id']} - {order_data['product_type']}",
-                "HTMLPart": f"<h3>New Order {order_data['order_id']}</h3><p>Customer: {order_data['name']}</p><p>Total: ₹{order_data['total_cost']}</p>"
+                "HTMLPart": html_body
             }
         ]
     }
     
-    try:
-        result = mailjet.send.create(data=data)
-        print(f"[EMAIL] Sent successfully. Status: {result.status_code}")
-        return result.status_code == 200
-    except Exception as e:
-        print(f"[EMAIL ERROR] {e}")
-        return False
+    for attempt in range(1, EMAIL_MAX_RETRIES + 1):
+        try:
+            result = mailjet.send.create(data=data)
+            if result.status_code == 200:
+                print(f"[EMAIL] Sent successfully. Status: {result.status_code}")
+                return True
+            print(f"[EMAIL ERROR] Attempt {attempt} failed. Status: {result.status_code}")
+        except Exception as e:
+            print(f"[EMAIL ERROR] Attempt {attempt}: {e}")
+        if attempt < EMAIL_MAX_RETRIES:
+            time.sleep(attempt)
+    return False
+
+email_executor = ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix="email")
+
+def _report_email_failure(future):
+    # Errors raised outside the retry loop (client setup, template rendering) would otherwise
+    # vanish with the discarded future
+    error = future.exception()
+    if error is not None:
+        print(f"[EMAIL ERROR] Notification task failed: {error!r}")
+
+def queue_email_notification(order_data):
+    future = email_executor.submit(send_email_notification, order_data)
+    future.add_done_callback(_report_email_failure)
 
 # =====================================================
 # AUTHENTICATION ROUTES
@@ -352,7 +617,9 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
         
-        if username in USERS and USERS[username]["password"] == password:
+        user = USERS.get(username)
+        pw_hash = user["pw_hash"] if user else _UNKNOWN_USER_HASH
+        if check_password_hash(pw_hash, password or "") and user:
             session['user'] = username
             session['role'] = USERS[username]["role"]
             session['name'] = USERS[username]["name"]
@@ -382,65 +649,83 @@ def index():
         return redirect('/dashboard')
     return redirect('/login')
 
+@cache.cached(timeout=30, key_prefix='dashboard_stats')
+def get_dashboard_stats():
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Get summary stats in a single pass over orders; one scalar row, so a plain tuple cursor
+    scalar_cursor = conn.cursor()
+    scalar_cursor.row_factory = None
+    scalar_cursor.execute("""
+        SELECT COUNT(*) as total_orders,
+               COALESCE(SUM(CASE WHEN status != 'Cancelled' THEN total_cost END), 0) as total_revenue,
+               COALESCE(SUM(advance_paid), 0) as total_collected,
+               (SELECT COUNT(*) FROM customers) as total_customers
+        FROM orders
+    """)
+    total_orders, total_revenue, total_collected, total_customers = scalar_cursor.fetchone()
+
+    # Orders by status
+    cursor.execute("""
+        SELECT status, COUNT(*) as count 
+        FROM orders 
+        GROUP BY status
+    """)
+    orders_by_status = [dict(row) for row in cursor.fetchall()]
+
+    # Monthly revenue (last 6 months)
+    cursor.execute("""
+        SELECT strftime('%Y-%m', created_at) as month, 
+               COUNT(*) as orders,
+               SUM(total_cost) as revenue
+        FROM orders
+        WHERE created_at >= date('now', '-6 months')
+        GROUP BY month
+        ORDER BY month
+    """)
+    monthly_rows = cursor.fetchall()
+
+    # Chart-ready series; the template ships it as a JSON island and draws the trend from it
+    monthly_chart = {
+        "labels": [row['month'] for row in monthly_rows],
+        "revenues": [row['revenue'] or 0 for row in monthly_rows],
+        "counts": [row['orders'] for row in monthly_rows],
+    }
+
+    # Plain values only: the cache pickles entries and sqlite3.Row can't be pickled
+    return (total_orders, total_customers, total_revenue,
+            total_collected, orders_by_status, monthly_chart)
+
+def invalidate_dashboard_stats():
+    # Only reaches this process's cache; other workers' entries age out on their timeouts
+    cache.delete_many('dashboard_stats', 'api_stats')
+
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Get summary stats
-        cursor.execute("SELECT COUNT(*) as total FROM orders")
-        total_orders = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COUNT(*) as total FROM customers")
-        total_customers = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COALESCE(SUM(total_cost), 0) as total FROM orders WHERE status != 'Cancelled'")
-        total_revenue = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COALESCE(SUM(advance_paid), 0) as total FROM orders")
-        total_collected = cursor.fetchone()['total']
-        
-        # Recent orders
-        cursor.execute("""
-            SELECT * FROM orders 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        """)
-        recent_orders = cursor.fetchall()
-        
-        # Orders by status
-        cursor.execute("""
-            SELECT status, COUNT(*) as count 
-            FROM orders 
-            GROUP BY status
-        """)
-        orders_by_status = cursor.fetchall()
-        
-        # Monthly revenue (last 6 months)
-        cursor.execute("""
-            SELECT strftime('%Y-%m', created_at) as month, 
-                   COUNT(*) as orders,
-                   SUM(total_cost) as revenue
-            FROM orders
-            WHERE created_at >= date('now', '-6 months')
-            GROUP BY month
-            ORDER BY month
-        """)
-        monthly_data = cursor.fetchall()
-        
-        return render_template("dashboard.html",
-                             total_orders=total_orders,
-                             total_customers=total_customers,
-                             total_revenue=total_revenue,
-                             total_collected=total_collected,
-                             recent_orders=recent_orders,
-                             orders_by_status=orders_by_status,
-                             monthly_data=monthly_data)
-    finally:
-        conn.close()
+    (total_orders, total_customers, total_revenue, total_collected,
+     orders_by_status, monthly_chart) = get_dashboard_stats()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Recent orders
+    cursor.execute("""
+        SELECT * FROM orders 
+        ORDER BY created_at DESC 
+        LIMIT 10
+    """)
+    recent_orders = cursor.fetchall()
+    
+    return render_template("dashboard.html",
+                         total_orders=total_orders,
+                         total_customers=total_customers,
+                         total_revenue=total_revenue,
+                         total_collected=total_collected,
+                         recent_orders=recent_orders,
+                         orders_by_status=orders_by_status,
+                         monthly_chart=monthly_chart)
 
 # =====================================================
 # ORDER ROUTES
@@ -476,20 +761,19 @@ def submit_order():
         if not no_of_units or no_of_units == "": no_of_units = 0
         soil_type = request.form.get("soil_type", "Normal")
 
-        # Get or create customer
-        customer_id = get_or_create_customer(mobile, name, address, city, state, pincode, country)
-        order_id = "ORD-" + uuid.uuid4().hex[:8].upper()
-
         # Calculate costs
         material_cost, installation_cost, transport_cost, total_cost, advance_payment = calculate_cost(
             acres, product_type, dimension, order_type, soil_type, no_of_units
         )
+        created_at = _now_str()
+
+        # Customer, order and stats are committed together
+        conn = get_db()
+        with transaction(conn):
+            customer_id = get_or_create_customer(mobile, name, address, city, state, pincode, country)
 
-        # Insert order
-        conn = sqlite3.connect("factory.db")
-        try:
             cursor = conn.cursor()
-            cursor.execute("""
+            order_id = insert_with_new_id(cursor, "ORD", """
                 INSERT INTO orders
                 (order_id, customer_id, name, mobile, country, state, city, pincode, address, 
                  acres, no_of_units, product_type, product_material, dimension, order_type,
@@ -497,22 +781,18 @@ def submit_order():
                  advance_paid, balance_due, delivery_date, payment_status, status, created_at, created_by, notes)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
-                order_id, customer_id, name, mobile, country, state, city, pincode, address,
+                customer_id, name, mobile, country, state, city, pincode, address,
                 acres, no_of_units, product_type, product_material, dimension, order_type,
                 soil_type, material_cost, installation_cost, transport_cost, total_cost,
                 advance_payment, 0, total_cost, delivery_date, 'Unpaid', 'Order placed',
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                created_at,
                 session.get('user', 'system'),
                 notes
             ))
-            conn.commit()
-        finally:
-            conn.close()
 
-        # Update customer stats
-        update_customer_stats(customer_id)
+            update_customer_stats(customer_id, total_cost, created_at)
 
-        # Log activity
+        invalidate_dashboard_stats()
         log_activity(session.get('user'), "CREATE", "order", order_id, f"New order created for {name}")
 
         # Send notifications
@@ -530,17 +810,37 @@ def submit_order():
             "advance_payment": advance_payment,
             "delivery_date": delivery_date
         }
-        if send_email_notification(order_info):
-            flash(f'Order {order_id} created successfully! Email sent.', 'success')
-        else:
-            flash(f'Order {order_id} created, but email failed. Check server logs.', 'warning')
-            
+        queue_email_notification(order_info)
+        flash(f'Order {order_id} created successfully! Email notification queued.', 'success')
+
         return redirect(f'/order_details/{order_id}')
     
     except Exception as e:
         flash(f'Error creating order: {str(e)}', 'danger')
         return redirect('/new_order')
 
+# Compare created_at directly (not date(created_at)) so the index can be used
+_ORDERS_LIST_WHERE = """
+    WHERE (:status IS NULL OR status = :status)
+      AND (:search IS NULL OR name LIKE :search OR mobile LIKE :search OR order_id LIKE :search)
+      AND (:date_from IS NULL OR created_at >= :date_from || ' 00:00:00')
+      AND (:date_to IS NULL OR created_at <= :date_to || ' 23:59:59')
+"""
+
+# Walks idx_orders_created_at in order and stops after the page
+ORDERS_LIST_SQL = f"""
+    SELECT * FROM orders {_ORDERS_LIST_WHERE}
+    ORDER BY created_at DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+# Kept separate: a COUNT(*) OVER () column on the page query would materialise and sort the
+# whole filtered set before the LIMIT applied
+ORDERS_COUNT_SQL = f"SELECT COUNT(*) FROM orders {_ORDERS_LIST_WHERE}"
+
+# Orders shown per page of the order list
+ORDERS_PAGE_SIZE = 50
+
 @app.route("/orders")
 @login_required
 def orders():
@@ -549,110 +849,89 @@ def orders():
     search = request.args.get('search', '')
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
+    page = max(request.args.get('page', 1, type=int), 1)
     
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        query = "SELECT * FROM orders WHERE 1=1"
-        params = []
-        
-        if status_filter:
-            query += " AND status = ?"
-            params.append(status_filter)
-        
-        if search:
-            query += " AND (name LIKE ? OR mobile LIKE ? OR order_id LIKE ?)"
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-        
-        if date_from:
-            query += " AND date(created_at) >= ?"
-            params.append(date_from)
-        
-        if date_to:
-            query += " AND date(created_at) <= ?"
-            params.append(date_to)
-        
-        query += " ORDER BY created_at DESC"
-        
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
-        # Get unique statuses for filter dropdown
-        cursor.execute("SELECT DISTINCT status FROM orders ORDER BY status")
-        statuses = [row['status'] for row in cursor.fetchall()]
-        
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Absent filters are bound as NULL so every request runs the same cached statements
+    filters = {
+        "status": status_filter or None,
+        "search": f"%{search}%" if search else None,
+        "date_from": date_from or None,
+        "date_to": date_to or None,
+    }
+    cursor.execute(ORDERS_LIST_SQL, dict(filters, limit=ORDERS_PAGE_SIZE,
+                                         offset=(page - 1) * ORDERS_PAGE_SIZE))
+    rows = cursor.fetchall()
+    # Counted on its own so a page past the end still knows the total and shows the pager
+    cursor.execute(ORDERS_COUNT_SQL, filters)
+    total_rows = cursor.fetchone()[0]
+    total_pages = max(math.ceil(total_rows / ORDERS_PAGE_SIZE), 1)
+    
+    # Get unique statuses for filter dropdown
+    cursor.execute("SELECT DISTINCT status FROM orders ORDER BY status")
+    statuses = [row['status'] for row in cursor.fetchall()]
 
     return render_template("orders_list.html", rows=rows, statuses=statuses,
                          status_filter=status_filter, search=search,
                          date_from=date_from, date_to=date_to,
+                         page=page, total_pages=total_pages, total_rows=total_rows,
                          workflows=WORKFLOW_STEPS)
 
 @app.route("/order_details/<order_id>")
 @login_required
 def order_details(order_id):
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,))
-        order = cursor.fetchone()
-        
-        if not order:
-            flash('Order not found', 'warning')
-            return redirect('/orders')
-        
-        # Get payment history
-        cursor.execute("""
-            SELECT * FROM payments 
-            WHERE order_id = ? 
-            ORDER BY payment_date DESC
-        """, (order_id,))
-        payments = cursor.fetchall()
-        
-        # Get activity log
-        cursor.execute("""
-            SELECT * FROM activity_log 
-            WHERE entity_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 20
-        """, (order_id,))
-        activities = cursor.fetchall()
-
-        current_workflow = WORKFLOW_STEPS.get(order['order_type'], WORKFLOW_STEPS["Material Purchase"])
-        
-        return render_template("order_details.html", 
-                             order=order, 
-                             payments=payments,
-                             activities=activities,
-                             workflow_steps=current_workflow)
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,))
+    order = cursor.fetchone()
+    
+    if not order:
+        flash('Order not found', 'warning')
+        return redirect('/orders')
+    
+    # Get payment history
+    cursor.execute("""
+        SELECT * FROM payments 
+        WHERE order_id = ? 
+        ORDER BY payment_date DESC
+    """, (order_id,))
+    payments = cursor.fetchall()
+    
+    # Get activity log
+    cursor.execute("""
+        SELECT * FROM activity_log 
+        WHERE entity_id = ? 
+        ORDER BY timestamp DESC 
+        LIMIT 20
+    """, (order_id,))
+    activities = cursor.fetchall()
+
+    current_workflow = WORKFLOW_STEPS.get(order['order_type'], WORKFLOW_STEPS["Material Purchase"])
+    
+    return render_template("order_details.html", 
+                         order=order, 
+                         payments=payments,
+                         activities=activities,
+                         workflow_steps=current_workflow)
 
 @app.route("/edit_order/<order_id>")
 @login_required
 def edit_order(order_id):
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,))
-        order = cursor.fetchone()
-        
-        if not order:
-            flash('Order not found', 'warning')
-            return redirect('/orders')
-        
-        current_workflow = WORKFLOW_STEPS.get(order['order_type'], WORKFLOW_STEPS["Material Purchase"])
-        
-        return render_template("order_form.html", order=order, workflow_steps=current_workflow)
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,))
+    order = cursor.fetchone()
+    
+    if not order:
+        flash('Order not found', 'warning')
+        return redirect('/orders')
+    
+    current_workflow = WORKFLOW_STEPS.get(order['order_type'], WORKFLOW_STEPS["Material Purchase"])
+    
+    return render_template("order_form.html", order=order, workflow_steps=current_workflow)
 
 @app.route("/update_order", methods=["POST"])
 @login_required
@@ -686,14 +965,14 @@ def update_order():
             acres, product_type, dimension, order_type, soil_type, no_of_units
         )
 
-        conn = sqlite3.connect("factory.db")
-        try:
+        conn = get_db()
+        with transaction(conn):
             cursor = conn.cursor()
-            
-            # Get current advance_paid
-            cursor.execute("SELECT advance_paid FROM orders WHERE order_id = ?", (order_id,))
-            current_paid = cursor.fetchone()[0]
-            
+
+            # Get current advance_paid and the total it is replacing
+            cursor.execute("SELECT advance_paid, total_cost, customer_id FROM orders WHERE order_id = ?", (order_id,))
+            current_paid, previous_total, customer_id = cursor.fetchone()
+
             balance_due = total_cost - current_paid
 
             cursor.execute("""
@@ -702,19 +981,17 @@ def update_order():
                 acres=?, no_of_units=?, product_type=?, product_material=?, dimension=?, order_type=?,
                 soil_type=?, material_cost=?, installation_cost=?, transport_cost=?, total_cost=?, 
                 advance_payment=?, balance_due=?, delivery_date=?, status=?, notes=?,
-                updated_at=?
+                updated_at=datetime('now', 'localtime')
                 WHERE order_id=?
             """, (name, mobile, country, state, city, pincode, address, acres, no_of_units, 
                   product_type, product_material, dimension, order_type, soil_type, 
                   material_cost, installation_cost, transport_cost, total_cost, advance_payment, 
                   balance_due, delivery_date, status, notes,
-                  datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                   order_id))
 
-            conn.commit()
-        finally:
-            conn.close()
+            adjust_customer_stats(customer_id, 0, total_cost - (previous_total or 0))
 
+        invalidate_dashboard_stats()
         log_activity(session.get('user'), "UPDATE", "order", order_id, f"Order updated")
         flash('Order updated successfully!', 'success')
         return redirect(f'/order_details/{order_id}')
@@ -729,15 +1006,18 @@ def update_order():
 def delete_order():
     order_id = request.form["order_id"]
     
-    conn = sqlite3.connect("factory.db")
-    try:
+    conn = get_db()
+    with transaction(conn):
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+        # Payments first: with foreign keys on, the order can't go while payments still reference it
         cursor.execute("DELETE FROM payments WHERE order_id = ?", (order_id,))
-        conn.commit()
-    finally:
-        conn.close()
+        cursor.execute("DELETE FROM orders WHERE order_id = ? RETURNING customer_id, total_cost", (order_id,))
+        deleted = cursor.fetchone()
+
+        if deleted:
+            adjust_customer_stats(deleted[0], -1, -(deleted[1] or 0))
     
+    invalidate_dashboard_stats()
     log_activity(session.get('user'), "DELETE", "order", order_id, "Order deleted")
     flash('Order deleted successfully', 'success')
     return redirect("/orders")
@@ -748,15 +1028,12 @@ def update_status():
     order_id = request.form["order_id"]
     new_status = request.form["status"]
     
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE orders SET status = ?, updated_at = ? WHERE order_id = ?", 
-                      (new_status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), order_id))
-        conn.commit()
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE orders SET status = ?, updated_at = datetime('now', 'localtime') WHERE order_id = ?", 
+                  (new_status, order_id))
     
+    invalidate_dashboard_stats()
     log_activity(session.get('user'), "UPDATE_STATUS", "order", order_id, f"Status changed to: {new_status}")
     flash(f'Order status updated to: {new_status}', 'success')
     
@@ -768,6 +1045,25 @@ def update_status():
 # PAYMENT ROUTES
 # =====================================================
 
+SQL_INSERT_PAYMENT = """
+    INSERT INTO payments 
+    (payment_id, order_id, customer_id, amount, payment_date, payment_method, 
+     reference_number, notes, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# The arithmetic runs against the row's current values, so concurrent payments can't lose an update
+SQL_UPDATE_ORDER_PAYMENT = """
+    UPDATE orders 
+    SET advance_paid = advance_paid + :amount,
+        balance_due = total_cost - (advance_paid + :amount),
+        payment_status = CASE WHEN total_cost - (advance_paid + :amount) <= 0
+                              THEN 'Paid' ELSE 'Partially Paid' END,
+        updated_at = datetime('now', 'localtime')
+    WHERE order_id = :order_id
+    RETURNING customer_id, balance_due, payment_status, updated_at
+"""
+
 @app.route("/add_payment/<order_id>", methods=["POST"])
 @login_required
 def add_payment(order_id):
@@ -776,101 +1072,143 @@ def add_payment(order_id):
     reference = request.form.get("reference", "")
     payment_notes = request.form.get("payment_notes", "")
     
-    payment_id = "PAY-" + uuid.uuid4().hex[:8].upper()
-    
-    conn = sqlite3.connect("factory.db")
-    try:
+    conn = get_db()
+    with transaction(conn):
         cursor = conn.cursor()
-        
-        # Get customer_id
-        cursor.execute("SELECT customer_id, advance_paid FROM orders WHERE order_id = ?", (order_id,))
-        order_data = cursor.fetchone()
-        customer_id = order_data[0]
-        current_paid = order_data[1]
-        
+
+        # Update order advance_paid and balance; the returned row supplies the payment's customer_id,
+        # and its SQLite-side timestamp dates the payment and log entry too
+        cursor.execute(SQL_UPDATE_ORDER_PAYMENT, {"amount": amount, "order_id": order_id})
+        row = cursor.fetchone()
+        if row is None:
+            flash('Order not found', 'warning')
+            return redirect('/orders')
+        customer_id, balance_due, payment_status, timestamp = row
+
         # Insert payment
-        cursor.execute("""
-            INSERT INTO payments 
-            (payment_id, order_id, customer_id, amount, payment_date, payment_method, 
-             reference_number, notes, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (payment_id, order_id, customer_id, amount, 
-              datetime.now().strftime("%Y-%m-%d"), payment_method, reference, payment_notes,
-              datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        
-        # Update order advance_paid and balance
-        new_paid = current_paid + amount
-        cursor.execute("SELECT total_cost FROM orders WHERE order_id = ?", (order_id,))
-        total_cost = cursor.fetchone()[0]
-        
-        new_balance = total_cost - new_paid
-        payment_status = 'Partially Paid'
-        if new_balance <= 0:
-            payment_status = 'Paid'
+        payment_id = insert_with_new_id(cursor, "PAY", SQL_INSERT_PAYMENT, (
+            order_id, customer_id, amount,
+            timestamp[:10], payment_method, reference, payment_notes,
+            timestamp))
 
-        cursor.execute("""
-            UPDATE orders 
-            SET advance_paid = ?,
-                balance_due = ?,
-                payment_status = ?,
-                updated_at = ?
-            WHERE order_id = ?
-        """, (new_paid, new_balance, payment_status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), order_id))
-        
-        conn.commit()
-    finally:
-        conn.close()
+    invalidate_dashboard_stats()
     log_activity(session.get('user'), "ADD_PAYMENT", "payment", payment_id, 
-                f"Payment of ₹{amount} added to order {order_id}")
-    flash(f'Payment of ₹{amount} recorded successfully!', 'success')
+                f"Payment of ₹{amount} added to order {order_id}", timestamp)
+    flash(f'Payment of ₹{amount} recorded successfully! Order is {payment_status}, '
+          f'balance ₹{balance_due or 0:.2f}.', 'success')
     return redirect(f'/order_details/{order_id}')
 
 # =====================================================
 # CUSTOMER ROUTES
 # =====================================================
 
+# Newest customers first; customers with no orders sort last, ties broken by id
+_CUSTOMERS_ORDER_BY = "ORDER BY IFNULL(last_order_date, '') DESC, customer_id DESC LIMIT :limit"
+
+# What customers_list.html shows, plus last_order_date for the next-page key
+_CUSTOMERS_LIST_COLUMNS = "customer_id, name, mobile, address, city, total_orders, last_order_date"
+
+CUSTOMERS_FIRST_PAGE_SQL = f"SELECT {_CUSTOMERS_LIST_COLUMNS} FROM customers {_CUSTOMERS_ORDER_BY}"
+
+# Keyset page: resumes strictly after the last (date, id) shown, without an OFFSET walk
+CUSTOMERS_NEXT_PAGE_SQL = f"""
+    SELECT {_CUSTOMERS_LIST_COLUMNS} FROM customers
+    WHERE IFNULL(last_order_date, '') <= :after_date
+      AND (IFNULL(last_order_date, '') < :after_date OR customer_id < :after_id)
+    {_CUSTOMERS_ORDER_BY}
+"""
+
+# Customers shown per page of the customer list
+CUSTOMERS_PAGE_SIZE = 50
+
 @app.route("/customers")
 @login_required
 def customers():
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM customers 
-            ORDER BY last_order_date DESC
-        """)
-        customers_list = cursor.fetchall()
-    finally:
-        conn.close()
+    after_id = request.args.get('after_id')
+    after_date = request.args.get('after', '')
+
+    conn = get_db()
+    cursor = conn.cursor()
+    # One extra row tells us whether there is a next page
+    params = {"limit": CUSTOMERS_PAGE_SIZE + 1}
+    if after_id:
+        cursor.execute(CUSTOMERS_NEXT_PAGE_SQL, dict(params, after_date=after_date, after_id=after_id))
+    else:
+        cursor.execute(CUSTOMERS_FIRST_PAGE_SQL, params)
+    customers_list = cursor.fetchmany(CUSTOMERS_PAGE_SIZE + 1)
+
+    next_page = None
+    if len(customers_list) > CUSTOMERS_PAGE_SIZE:
+        customers_list = customers_list[:CUSTOMERS_PAGE_SIZE]
+        last = customers_list[-1]
+        next_page = {"after": last['last_order_date'] or '', "after_id": last['customer_id']}
     
-    return render_template("customers_list.html", customers=customers_list)
+    return render_template("customers_list.html", customers=customers_list,
+                         next_page=next_page, is_first_page=not after_id)
+
+_CUSTOMER_ORDERS_SELECT = """
+    SELECT order_id, order_type, product_type, product_material, dimension,
+           total_cost, advance_paid, balance_due, delivery_date,
+           status, payment_status, created_at
+    FROM orders
+"""
+_CUSTOMER_ORDERS_ORDER_BY = "ORDER BY created_at DESC, order_id DESC LIMIT :limit"
+
+# A customer's orders, newest first, seeking idx_orders_customer_created
+CUSTOMER_ORDERS_FIRST_PAGE_SQL = f"""
+    {_CUSTOMER_ORDERS_SELECT}
+    WHERE customer_id = :customer_id
+    {_CUSTOMER_ORDERS_ORDER_BY}
+"""
+
+# Keyset page: resumes strictly after the last (created_at, order_id) shown
+CUSTOMER_ORDERS_NEXT_PAGE_SQL = f"""
+    {_CUSTOMER_ORDERS_SELECT}
+    WHERE customer_id = :customer_id AND (created_at, order_id) < (:after_date, :after_id)
+    {_CUSTOMER_ORDERS_ORDER_BY}
+"""
+
+# Orders shown per page of a customer's order history
+CUSTOMER_ORDERS_PAGE_SIZE = 50
 
 @app.route("/customer_details/<customer_id>")
 @login_required
 def customer_details(customer_id):
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM customers WHERE customer_id = ?", (customer_id,))
-        customer = cursor.fetchone()
-        
-        if not customer:
-            flash('Customer not found', 'warning')
-            return redirect('/customers')
-        
-        cursor.execute("""
-            SELECT * FROM orders 
-            WHERE customer_id = ? 
-            ORDER BY created_at DESC
-        """, (customer_id,))
-        orders_list = cursor.fetchall()
-        
-        return render_template("customer_details.html", customer=customer, orders=orders_list)
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT * FROM customers WHERE customer_id = ?", (customer_id,))
+    customer = cursor.fetchone()
+    
+    if not customer:
+        flash('Customer not found', 'warning')
+        return redirect('/customers')
+    
+    after_id = request.args.get('after_id')
+    after_date = request.args.get('after', '')
+
+    # Plain tuples zipped into dicts once, so the template's per-field lookups are dict hits
+    orders_cursor = conn.cursor()
+    orders_cursor.row_factory = None
+    # One extra row tells us whether there is a next page
+    params = {"customer_id": customer_id, "limit": CUSTOMER_ORDERS_PAGE_SIZE + 1}
+    if after_id:
+        orders_cursor.execute(CUSTOMER_ORDERS_NEXT_PAGE_SQL,
+                              dict(params, after_date=after_date, after_id=after_id))
+    else:
+        orders_cursor.execute(CUSTOMER_ORDERS_FIRST_PAGE_SQL, params)
+    columns = [col[0] for col in orders_cursor.description]
+    orders_list = [dict(zip(columns, row))
+                   for row in orders_cursor.fetchmany(CUSTOMER_ORDERS_PAGE_SIZE + 1)]
+
+    next_page = None
+    if len(orders_list) > CUSTOMER_ORDERS_PAGE_SIZE:
+        orders_list = orders_list[:CUSTOMER_ORDERS_PAGE_SIZE]
+        last = orders_list[-1]
+        next_page = {"after": last['created_at'], "after_id": last['order_id']}
+    
+    return render_template("customer_details.html", customer=customer, orders=orders_list,
+                         next_page=next_page, is_first_page=not after_id)
 
 # =====================================================
 # REPORTS & ANALYTICS
@@ -880,97 +1218,116 @@ def customer_details(customer_id):
 @login_required
 @role_required('owner', 'manager')
 def reports():
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Revenue by product type
-        cursor.execute("""
-            SELECT product_type, 
-                   COUNT(*) as orders,
-                   SUM(total_cost) as revenue
-            FROM orders
-            WHERE status != 'Cancelled'
-            GROUP BY product_type
-        """)
-        revenue_by_product = cursor.fetchall()
-        
-        # Top customers
-        cursor.execute("""
-            SELECT name, mobile, total_orders, total_spent
-            FROM customers
-            ORDER BY total_spent DESC
-            LIMIT 10
-        """)
-        top_customers = cursor.fetchall()
-        
-        # Order type distribution
-        cursor.execute("""
-            SELECT order_type, COUNT(*) as count
-            FROM orders
-            GROUP BY order_type
-        """)
-        order_type_dist = cursor.fetchall()
-        
-        return render_template("reports.html",
-                             revenue_by_product=revenue_by_product,
-                             top_customers=top_customers,
-                             order_type_dist=order_type_dist)
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Product and order type breakdowns come from one pass over orders, folded up below
+    cursor.execute("""
+        SELECT product_type, order_type,
+               COALESCE(status != 'Cancelled', 0) as billable,
+               COUNT(*) as orders,
+               SUM(total_cost) as revenue
+        FROM orders
+        GROUP BY product_type, order_type, billable
+    """)
+    by_product = {}
+    by_order_type = {}
+    for row in cursor.fetchall():
+        if row['billable']:
+            product = by_product.setdefault(row['product_type'], {
+                "product_type": row['product_type'], "orders": 0, "revenue": 0})
+            product["orders"] += row['orders']
+            product["revenue"] += row['revenue'] or 0
+        by_order_type[row['order_type']] = by_order_type.get(row['order_type'], 0) + row['orders']
+
+    # Same order GROUP BY gave: NULL first, then by value
+    def group_key(key):
+        return (key is not None, key or "")
+
+    revenue_by_product = [by_product[k] for k in sorted(by_product, key=group_key)]
+    order_type_dist = [{"order_type": k, "count": by_order_type[k]}
+                       for k in sorted(by_order_type, key=group_key)]
+    
+    # Top customers
+    cursor.execute("""
+        SELECT name, mobile, total_orders, total_spent
+        FROM customers
+        ORDER BY total_spent DESC
+        LIMIT 10
+    """)
+    top_customers = cursor.fetchall()
+    
+    return render_template("reports.html",
+                         revenue_by_product=revenue_by_product,
+                         top_customers=top_customers,
+                         order_type_dist=order_type_dist)
 
 # =====================================================
 # ADMIN ROUTES
 # =====================================================
 
+# The OR across two columns split into one indexed branch each; the second excludes placed
+# orders (IS NOT keeps NULL statuses) so nothing is listed twice. Both branches stream in
+# created_at order (idx_orders_status_created and the partial idx_orders_unpaid_created),
+# so the merge stops after the limit instead of sorting everything.
+_ADMIN_ORDER_COLUMNS = "order_id, name, mobile, created_at, total_cost, status, payment_status"
+
+ADMIN_ORDERS_SQL = f"""
+    SELECT {_ADMIN_ORDER_COLUMNS} FROM orders WHERE status = 'Order placed'
+    UNION ALL
+    SELECT {_ADMIN_ORDER_COLUMNS} FROM orders WHERE payment_status != 'Paid' AND status IS NOT 'Order placed'
+    ORDER BY created_at DESC
+    LIMIT :limit
+"""
+
+# Most recent orders shown in the admin queue
+ADMIN_ORDERS_LIMIT = 100
+
 @app.route("/admin/orders")
 @login_required
 @role_required('owner', 'manager')
 def admin_orders():
-    conn = sqlite3.connect("factory.db")
-    try:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Fetch orders that need approval or have pending payments
-        cursor.execute("""
-            SELECT * FROM orders 
-            WHERE status = 'Order placed' OR payment_status != 'Paid'
-            ORDER BY created_at DESC
-        """)
-        orders = cursor.fetchall()
-        
-        return render_template("admin_orders.html", orders=orders)
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Fetch orders that need approval or have pending payments; one extra row tells the
+    # page that older ones were left out
+    cursor.execute(ADMIN_ORDERS_SQL, {"limit": ADMIN_ORDERS_LIMIT + 1})
+    orders = cursor.fetchall()
+    truncated = len(orders) > ADMIN_ORDERS_LIMIT
+    
+    return render_template("admin_orders.html", orders=orders[:ADMIN_ORDERS_LIMIT],
+                         truncated=truncated, limit=ADMIN_ORDERS_LIMIT)
+
+# Approval as one guarded UPDATE: the next step comes from the CASE, and only a placed
+# order matches, so two concurrent approvals can't both advance it
+SQL_APPROVE_ORDER = f"""
+    UPDATE orders
+    SET status = CASE order_type {" ".join("WHEN ? THEN ?" for _ in NEXT_AFTER_PLACED)}
+                 ELSE 'Processing' END,
+        updated_at = datetime('now', 'localtime')
+    WHERE order_id = ? AND status = 'Order placed'
+    RETURNING status, updated_at
+"""
+_APPROVE_ORDER_PARAMS = tuple(value for pair in NEXT_AFTER_PLACED.items() for value in pair)
 
 @app.route("/admin/approve_order", methods=["POST"])
 @login_required
 @role_required('owner', 'manager')
 def admin_approve_order():
     order_id = request.form["order_id"]
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT order_type FROM orders WHERE order_id = ?", (order_id,))
-        order_type = cursor.fetchone()[0]
-        
-        workflow = WORKFLOW_STEPS.get(order_type, [])
-        try:
-            current_index = workflow.index('Order placed')
-            new_status = workflow[current_index + 1]
-        except (ValueError, IndexError):
-            new_status = 'Processing'
-
-        cursor.execute("UPDATE orders SET status = ?, updated_at = ? WHERE order_id = ?", 
-                      (new_status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), order_id))
-        conn.commit()
-        
-        log_activity(session.get('user'), "APPROVE", "order", order_id, f"Order approved. Status: {new_status}")
-        flash(f'Order {order_id} approved. Status is now "{new_status}".', 'success')
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(SQL_APPROVE_ORDER, _APPROVE_ORDER_PARAMS + (order_id,))
+    row = cursor.fetchone()
+    if row is None:
+        flash(f'Order {order_id} is no longer awaiting approval.', 'warning')
+        return redirect(url_for('admin_orders'))
+    new_status, timestamp = row
+    
+    invalidate_dashboard_stats()
+    log_activity(session.get('user'), "APPROVE", "order", order_id, f"Order approved. Status: {new_status}", timestamp)
+    flash(f'Order {order_id} approved. Status is now "{new_status}".', 'success')
     return redirect(url_for('admin_orders'))
 
 @app.route("/admin/update_payment_status", methods=["POST"])
@@ -980,58 +1337,84 @@ def admin_update_payment_status():
     order_id = request.form["order_id"]
     new_payment_status = request.form["payment_status"]
     
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE orders SET payment_status = ?, updated_at = ? WHERE order_id = ?", 
-                      (new_payment_status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), order_id))
-        conn.commit()
-        
-        log_activity(session.get('user'), "UPDATE_PAYMENT_STATUS", "order", order_id, f"Payment status set to: {new_payment_status}")
-        flash(f'Payment status for order {order_id} updated to "{new_payment_status}".', 'success')
-    finally:
-        conn.close()
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE orders SET payment_status = ?, updated_at = datetime('now', 'localtime') WHERE order_id = ?", 
+                  (new_payment_status, order_id))
+    
+    invalidate_dashboard_stats()
+    log_activity(session.get('user'), "UPDATE_PAYMENT_STATUS", "order", order_id, f"Payment status set to: {new_payment_status}")
+    flash(f'Payment status for order {order_id} updated to "{new_payment_status}".', 'success')
     return redirect(url_for('admin_orders'))
 
+@app.route("/admin/recompute_customer_stats", methods=["POST"])
+@login_required
+@role_required('owner', 'manager')
+def admin_recompute_customer_stats():
+    recompute_customer_stats()
+    log_activity(session.get('user'), "RECOMPUTE_STATS", "customer", "all", "Customer totals recalculated")
+    flash('Customer totals recalculated from order history.', 'success')
+    return redirect(url_for('admin_orders'))
 
 # =====================================================
 # API ENDPOINTS
 # =====================================================
 
+# Its own short entry, so a poll is never staler than the max-age it is sent with, even on
+# a worker that didn't see the write
+@cache.cached(timeout=5, key_prefix='api_stats')
+def get_api_stats():
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT COUNT(*),
+               COALESCE(SUM(CASE WHEN status != 'Cancelled' THEN total_cost END), 0),
+               (SELECT COUNT(*) FROM customers)
+        FROM orders
+    """)
+    total_orders, total_revenue, total_customers = cursor.fetchone()
+
+    cursor.execute("SELECT status, COUNT(*) FROM orders GROUP BY status")
+    status_counts = dict(cursor.fetchall())
+
+    return {
+        "total_orders": total_orders,
+        "total_customers": total_customers,
+        "total_revenue": total_revenue,
+        "status_counts": status_counts
+    }
+
 @app.route("/api/stats")
 @login_required
 def api_stats():
-    conn = sqlite3.connect("factory.db")
-    try:
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        total_orders = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM customers")
-        total_customers = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COALESCE(SUM(total_cost), 0) FROM orders WHERE status != 'Cancelled'")
-        total_revenue = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT status, COUNT(*) FROM orders GROUP BY status")
-        status_counts = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        return jsonify({
-            "total_orders": total_orders,
-            "total_customers": total_customers,
-            "total_revenue": total_revenue,
-            "status_counts": status_counts
-        })
-    finally:
-        conn.close()
+    response = jsonify(get_api_stats())
+    # Short-lived and per-user; a poll with a matching ETag gets an empty 304
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.max_age = 5
+    return response.make_conditional(request)
+
+def _json_payload(value):
+    body = json.dumps(value, separators=(",", ":")).encode()
+    return body, hashlib.md5(body).hexdigest()
+
+# Bodies and ETags per product type are fixed for the life of the process, so build them once
+_PRODUCT_PAYLOADS = MappingProxyType({
+    product_type: _json_payload(list(dims)) for product_type, dims in PRODUCT_DIMS.items()
+})
+_NO_PRODUCTS_PAYLOAD = _json_payload([])
 
 @app.route("/api/products")
 @login_required
 def api_products():
     product_type = request.args.get('type')
-    dimensions = sorted([rate[1] for rate in PRODUCT_RATES if rate[0] == product_type])
-    return jsonify(dimensions)
+    body, etag = _PRODUCT_PAYLOADS.get(product_type, _NO_PRODUCTS_PAYLOAD)
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Private because the endpoint sits behind login; shared proxies must not keep it
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
 
 
 # =====================================================
@@ -1,5 +1,4 @@
 import os
-import shutil
 
 def fix_project_structure():
     # Get the current directory where this script is running
@@ -7,10 +6,15 @@ def fix_project_structure():
     templates_dir = os.path.join(base_dir, 'templates')
 
     # 1. Create templates directory if it doesn't exist
-    if not os.path.exists(templates_dir):
+    if not os.path.isdir(templates_dir):
         os.makedirs(templates_dir)
         print(f"Created directory: {templates_dir}")
 
+    # List both directories once and decide against these sets instead of a stat per check;
+    # the steps below keep `present` in sync as they move, rename and create files
+    root_files = {entry.name for entry in os.scandir(base_dir) if entry.is_file()}
+    present = {entry.name for entry in os.scandir(templates_dir)}
+
     # 2. Move HTML files from root to templates/
     files_to_move = ['login.html', 'dashboard.html', 'order_details.html']
     
@@ -18,13 +22,12 @@ def fix_project_structure():
         src = os.path.join(base_dir, filename)
         dst = os.path.join(templates_dir, filename)
         
-        if os.path.exists(src):
-            # If destination exists, remove it first to ensure we use the new one
-            if os.path.exists(dst):
-                os.remove(dst)
-            shutil.move(src, dst)
+        if filename in root_files:
+            # Same filesystem, so this is a single rename; it overwrites dst so the new file wins
+            os.replace(src, dst)
+            present.add(filename)
             print(f"✅ Moved {filename} to templates/ folder")
-        elif os.path.exists(dst):
+        elif filename in present:
             print(f"ℹ️  {filename} is already in templates/ folder")
         else:
             print(f"⚠️  Warning: Could not find {filename} in root folder")
@@ -39,25 +42,29 @@ def fix_project_structure():
         old_path = os.path.join(templates_dir, old_name)
         new_path = os.path.join(templates_dir, new_name)
         
-        if os.path.exists(old_path):
-            if not os.path.exists(new_path):
-                os.rename(old_path, new_path)
+        if old_name in present:
+            if new_name not in present:
+                os.replace(old_path, new_path)
+                present.discard(old_name)
+                present.add(new_name)
                 print(f"✅ Renamed {old_name} to {new_name}")
             else:
                 print(f"ℹ️  {new_name} already exists (skipping rename)")
 
     # 3b. Cleanup stale index.html if order_form.html exists
-    if os.path.exists(os.path.join(templates_dir, 'index.html')) and os.path.exists(os.path.join(templates_dir, 'order_form.html')):
+    if 'index.html' in present and 'order_form.html' in present:
         os.remove(os.path.join(templates_dir, 'index.html'))
+        present.discard('index.html')
         print("✅ Removed stale index.html (replaced by order_form.html)")
 
     # 4. Create dummy files for missing templates
     missing_templates = ['customers_list.html', 'customer_details.html', 'reports.html', 'admin_orders.html']
     for template in missing_templates:
-        path = os.path.join(templates_dir, template)
-        if not os.path.exists(path):
+        if template not in present:
+            path = os.path.join(templates_dir, template)
             with open(path, 'w') as f:
                 f.write(f"<html><body><h1>{template}</h1><p>Placeholder</p><a href='/dashboard'>Back</a></body></html>")
+            present.add(template)
             print(f"✅ Created placeholder for: {template}")
 
     print("\n🎉 Fix complete! You can now run 'python enhanced_app.py'")